@@ -1,24 +1,36 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from collections import OrderedDict
 from pathlib import Path
+import asyncio
+import errno
+import heapq
+import itertools
+import os
 import shutil
-import uuid
 
-app = FastAPI(title="Cat Classifier Backend")
+# orjson serializes the large image listings in C, several times faster than stdlib json.
+app = FastAPI(title="Cat Classifier Backend", default_response_class=ORJSONResponse)
 
+# The UI is normally served by this app (same origin); CORS is only for local dev frontends.
+# Wildcard origins with credentials is invalid per the CORS spec, so list them explicitly.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=["http://localhost:5173", "http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type"],
+    max_age=86400,  # let browsers cache preflight results for a day
 )
 
 ROOT = Path(__file__).resolve().parent.parent / 'public' / 'cat_pics'
 CLASSIFIED_ROOT = ROOT / 'classified'
 CLASSIFIED_ROOT.mkdir(parents=True, exist_ok=True)
+# URLs are paths relative to public/; slicing this prefix off is cheaper than Path.relative_to.
+_ROOT_PARENT_PREFIX = str(ROOT.parent) + os.sep
 
 FEEDER_FOLDERS = [
     'dualfeeder/cam1',
@@ -29,13 +41,17 @@ FEEDER_FOLDERS = [
 ]
 
 REFERENCE_DIR = ROOT / 'reference'
+REFERENCE_EXTS = ['.jpg','.jpeg','.png','.webp','.gif']  # lookup preference order
 
 def _discover_cat_names():
     names = []
-    if REFERENCE_DIR.exists():
-        for p in sorted(REFERENCE_DIR.iterdir()):
-            if p.is_file() and p.suffix.lower() in {'.jpg','.jpeg','.png','.webp','.gif'}:
-                stem = p.stem.lower()
+    if REFERENCE_DIR.is_dir():
+        with os.scandir(REFERENCE_DIR) as it:
+            files = sorted(e.name for e in it if e.is_file(follow_symlinks=False))
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in REFERENCE_EXTS:
+                stem = stem.lower()
                 if stem in ('unknown','not_cat'):  # reserved special categories
                     continue
                 names.append(stem)
@@ -44,26 +60,76 @@ def _discover_cat_names():
 # Dynamic categories: real cat names from reference images + 'unknown' + 'not_a_cat'
 CAT_NAMES = _discover_cat_names()
 SPECIAL_CATEGORIES = ['unknown', 'not_a_cat']
-VALID_CATEGORIES = set(CAT_NAMES + SPECIAL_CATEGORIES)
+VALID_CATEGORIES = frozenset(CAT_NAMES + SPECIAL_CATEGORIES)
 
 class ClassifyRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
     image_id: str
     category: str
 
 class UndoRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
     image_id: str
 
-# In-memory moves history for undo (non-persistent)
-MOVE_HISTORY = []  # list of dicts {image_id, original_path, new_path}
+def _count_files(path: Path) -> int:
+    if not path.is_dir():
+        return 0
+    with os.scandir(path) as it:
+        return sum(1 for e in it if e.is_file(follow_symlinks=False))
+
+# Classified counts per category, seeded once at startup and kept current by classify/undo.
+# Only this process moves files into CLASSIFIED_ROOT, so run a single uvicorn worker.
+CATEGORY_COUNTS: dict[str, int] = {c: _count_files(CLASSIFIED_ROOT / c) for c in VALID_CATEGORIES}
+
+# Opaque image ids: process-local integer tokens mapped to server paths (never sent to the client).
+# Oldest tokens are evicted once _TOKENS_MAX is exceeded; clients re-list images after a restart anyway.
+_TOKEN_SEQ = itertools.count(1)
+_TOKENS: OrderedDict[int, str] = OrderedDict()  # token -> absolute path string
+_TOKENS_MAX = 100_000
+
+def _issue_token(path: str) -> str:
+    tok = next(_TOKEN_SEQ)
+    _TOKENS[tok] = path
+    if len(_TOKENS) > _TOKENS_MAX:
+        _TOKENS.popitem(last=False)
+    return str(tok)
+
+def _parse_token(image_id: str) -> int:
+    try:
+        return int(image_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Bad image id')
+
+# In-memory moves history for undo (non-persistent), keyed by image id in classification order.
+# Only the most recent _MOVE_HISTORY_MAX moves can be undone.
+MOVE_HISTORY: OrderedDict[str, dict] = OrderedDict()  # image_id -> {original_path, new_path}
+_MOVE_HISTORY_MAX = 10_000
+
+# Feeder folders are fixed on disk; resolve which exist once at startup.
+_FEEDERS_RESPONSE = { 'feeders': [f for f in FEEDER_FOLDERS if (ROOT / f).is_dir()] }
 
 @app.get('/api/feeders')
 async def get_feeders():
-    feeders = []
-    for f in FEEDER_FOLDERS:
-        feeder_path = ROOT / f
-        if feeder_path.exists():
-            feeders.append(f)
-    return { 'feeders': feeders }
+    return _FEEDERS_RESPONSE
+
+IMAGE_EXTS = {'jpg','jpeg','png','gif','webp'}
+
+def _scan_images(dir_path: Path, k: int) -> tuple[int, list[tuple[str, str]]]:
+    """Return (total matching images, first k (name, path) pairs by name) from one scandir pass.
+
+    DirEntry.is_file() uses the cached dirent type, and heapq.nsmallest keeps only k
+    entries instead of sorting the whole directory.
+    """
+    total = 0
+    def matching(it):
+        nonlocal total
+        for e in it:
+            if e.name.rpartition('.')[2].lower() in IMAGE_EXTS and e.is_file(follow_symlinks=False):
+                total += 1
+                yield e.name, e.path
+    with os.scandir(dir_path) as it:
+        first = heapq.nsmallest(k, matching(it))
+    return total, first
 
 @app.get('/api/images')
 async def list_images(feeder: str, source: str = 'cats', offset: int = 0, limit: int = 200):
@@ -75,129 +141,170 @@ async def list_images(feeder: str, source: str = 'cats', offset: int = 0, limit:
     feeder_path = ROOT / feeder / source
     if not feeder_path.exists():
         raise HTTPException(status_code=404, detail='Feeder/source not found')
-    exts = {'.jpg','.jpeg','.png','.gif','.webp'}
-    all_files = [p for p in sorted(feeder_path.glob('*')) if p.is_file() and p.suffix.lower() in exts]
-    total = len(all_files)
     if offset < 0: offset = 0
     limit = max(1, min(limit, 1000))
-    slice_files = all_files[offset: offset + limit]
+    total, first = _scan_images(feeder_path, offset + limit)
+    slice_files = first[offset:]
     images = []
-    for p in slice_files:
-        rel = p.relative_to(ROOT.parent)  # relative to public
-        image_id = str(uuid.uuid4()) + '|' + str(p)
-        images.append({ 'id': image_id, 'url': '/' + str(rel).replace('\\','/'), 'filename': p.name })
+    prefix_len = len(_ROOT_PARENT_PREFIX)
+    for name, path_str in slice_files:
+        rel = path_str[prefix_len:]  # relative to public
+        if os.sep != '/':
+            rel = rel.replace(os.sep, '/')
+        images.append({ 'id': _issue_token(path_str), 'url': '/' + rel, 'filename': name })
     return { 'images': images, 'total': total, 'offset': offset, 'limit': limit }
 
+# Highest numeric suffix handed out per directory, keyed by (stem, suffix), so collisions
+# don't have to probe _1, _2, ... one stat at a time. Seeded by one scandir per directory.
+_SUFFIX_COUNTERS: dict[Path, dict[tuple[str, str], int]] = {}
+
+def _scan_suffixes(dir_path: Path) -> dict[tuple[str, str], int]:
+    counters = {}
+    with os.scandir(dir_path) as it:
+        for e in it:
+            root, suffix = os.path.splitext(e.name)
+            stem, sep, num = root.rpartition('_')
+            if sep and num.isdigit():
+                key = (stem, suffix)
+                counters[key] = max(counters.get(key, 0), int(num))
+    return counters
+
 def _unique_path(path: Path) -> Path:
     """Return a unique, non-existing path by adding _1, _2, ... if needed."""
     if not path.exists():
         return path
-    i = 1
+    counters = _SUFFIX_COUNTERS.get(path.parent)
+    if counters is None:
+        counters = _SUFFIX_COUNTERS[path.parent] = _scan_suffixes(path.parent)
+    key = (path.stem, path.suffix)
+    i = counters.get(key, 0)
     while True:
+        # Normally succeeds first try; loops only if files appeared behind our back.
+        i += 1
         candidate = path.with_name(f"{path.stem}_{i}{path.suffix}")
         if not candidate.exists():
+            counters[key] = i
             return candidate
-        i += 1
+
+# Moves run in a worker thread so the event loop keeps serving listings and static files;
+# the lock keeps concurrent moves from picking the same unique target name.
+_MOVE_LOCK = asyncio.Lock()
+
+def _move_unique(src: Path, dst: Path) -> Path:
+    """Move src to a unique path derived from dst, creating its directory. Returns the final path."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst = _unique_path(dst)
+    # Same filesystem (the usual case under ROOT): a single rename syscall.
+    # _unique_path already guaranteed dst is free, so os.replace cannot clobber anything.
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(src), str(dst))
+    return dst
 
 @app.post('/api/classify')
 async def classify(req: ClassifyRequest):
     if req.category not in VALID_CATEGORIES:
         raise HTTPException(status_code=400, detail='Invalid category')
-    try:
-        _uuid_part, orig_path_str = req.image_id.split('|', 1)
-    except ValueError:
-        raise HTTPException(status_code=400, detail='Bad image id')
+    tok = _parse_token(req.image_id)
+    orig_path_str = _TOKENS.get(tok)
+    if orig_path_str is None:
+        raise HTTPException(status_code=404, detail='Unknown or expired image id')
     orig_path = Path(orig_path_str)
-    if not orig_path.exists():
-        raise HTTPException(status_code=404, detail='Original image not found (was it already classified?)')
-    target_dir = CLASSIFIED_ROOT / req.category
-    target_dir.mkdir(parents=True, exist_ok=True)
-    target_path = _unique_path(target_dir / orig_path.name)
 
     # Move instead of copy so source directory is cleaned up.
     try:
-        shutil.move(str(orig_path), str(target_path))
+        async with _MOVE_LOCK:
+            target_path = await asyncio.to_thread(_move_unique, orig_path, CLASSIFIED_ROOT / req.category / orig_path.name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail='Original image not found (was it already classified?)')
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to move file: {e}')
+    CATEGORY_COUNTS[req.category] += 1
+    _TOKENS.pop(tok, None)
 
-    MOVE_HISTORY.append({ 'image_id': req.image_id, 'original_path': orig_path, 'new_path': target_path })
+    MOVE_HISTORY[req.image_id] = { 'original_path': orig_path, 'new_path': target_path }
+    if len(MOVE_HISTORY) > _MOVE_HISTORY_MAX:
+        MOVE_HISTORY.popitem(last=False)
     return { 'status': 'ok', 'stored_at': str(target_path.relative_to(ROOT.parent)), 'moved': True }
 
 @app.post('/api/undo')
 async def undo(req: UndoRequest):
-    # Find last move with this image id
-    for i in range(len(MOVE_HISTORY)-1, -1, -1):
-        m = MOVE_HISTORY[i]
-        if m['image_id'] == req.image_id:
-            new_path = m['new_path']
-            orig_path = m['original_path']
-            if new_path.exists():
-                # Restore to original location; ensure directory exists
-                orig_parent = orig_path.parent
-                orig_parent.mkdir(parents=True, exist_ok=True)
-                restore_path = orig_path if not orig_path.exists() else _unique_path(orig_path)
-                try:
-                    shutil.move(str(new_path), str(restore_path))
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f'Failed to restore file: {e}')
-            MOVE_HISTORY.pop(i)
-            return { 'status': 'ok', 'restored_to': str(orig_path) }
-    raise HTTPException(status_code=404, detail='No move to undo for image')
+    m = MOVE_HISTORY.get(req.image_id)
+    if m is None:
+        raise HTTPException(status_code=404, detail='No move to undo for image')
+    new_path = m['new_path']
+    orig_path = m['original_path']
+    # Restore to original location (or a unique sibling if it was reused)
+    try:
+        async with _MOVE_LOCK:
+            await asyncio.to_thread(_move_unique, new_path, orig_path)
+    except FileNotFoundError:
+        pass  # classified copy is already gone; just forget the move
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to restore file: {e}')
+    else:
+        cat = new_path.parent.name
+        if CATEGORY_COUNTS.get(cat, 0) > 0:
+            CATEGORY_COUNTS[cat] -= 1
+    MOVE_HISTORY.pop(req.image_id, None)
+    return { 'status': 'ok', 'restored_to': str(orig_path.relative_to(ROOT.parent)) }
 
 
 @app.get('/api/stats')
 async def stats():
-    """Return counts of already classified images per category."""
-    counts = {}
-    for cat in VALID_CATEGORIES:
-        cat_dir = CLASSIFIED_ROOT / cat
-        if cat_dir.exists():
-            counts[cat] = sum(1 for p in cat_dir.iterdir() if p.is_file())
-        else:
-            counts[cat] = 0
-    return { 'counts': counts }
+    """Return counts of already classified images per category (served from memory)."""
+    return { 'counts': dict(CATEGORY_COUNTS) }
+
+def _build_categories_response():
+    """Build the /api/categories payload from a single scan of REFERENCE_DIR."""
+    refs = {}  # (stem_lower, ext_lower) -> filename
+    if REFERENCE_DIR.is_dir():
+        with os.scandir(REFERENCE_DIR) as it:
+            for e in it:
+                stem, dot, ext = e.name.rpartition('.')
+                if dot and e.is_file(follow_symlinks=False):
+                    refs.setdefault((stem.lower(), '.' + ext.lower()), e.name)
+
+    def ref_url(stem):
+        for ext in REFERENCE_EXTS:
+            fname = refs.get((stem, ext))
+            if fname:
+                rel = (REFERENCE_DIR / fname).relative_to(ROOT.parent)
+                return '/' + str(rel).replace('\\','/')
+        return None
+
+    # Provide cats in discovered order, then the specials
+    categories = [{ 'key': name, 'label': name.capitalize(), 'reference': ref_url(name) } for name in CAT_NAMES]
+    categories.append({ 'key': 'unknown', 'label': 'Unknown', 'reference': ref_url('unknown') })
+    categories.append({ 'key': 'not_a_cat', 'label': 'Not a Cat', 'reference': ref_url('not_cat') })
+    return { 'categories': categories }
+
+# Reference images are only read at startup, so the categories payload never changes.
+_CATEGORIES_RESPONSE = _build_categories_response()
 
 @app.get('/api/categories')
 async def list_categories():
     """Return ordered list of category descriptors with optional reference image URLs."""
-    categories = []
-    # Provide cats in discovered order
-    for name in CAT_NAMES:
-        ref_path = None
-        p = REFERENCE_DIR / f"{name}.jpg"
-        if not p.exists():
-            # try any extension
-            for ext in ['.jpeg','.png','.webp','.gif']:
-                alt = REFERENCE_DIR / f"{name}{ext}"
-                if alt.exists():
-                    p = alt
-                    break
-        if p.exists():
-            rel = p.relative_to(ROOT.parent)
-            ref_path = '/' + str(rel).replace('\\','/')
-        categories.append({
-            'key': name,
-            'label': name.capitalize(),
-            'reference': ref_path
-        })
-    # Specials
-    # unknown
-    unk_ref = None
-    unk_file = REFERENCE_DIR / 'unknown.jpg'
-    if unk_file.exists():
-        unk_ref = '/' + str(unk_file.relative_to(ROOT.parent)).replace('\\','/')
-    categories.append({ 'key': 'unknown', 'label': 'Unknown', 'reference': unk_ref })
-    # not a cat
-    na_ref = None
-    na_file = REFERENCE_DIR / 'not_cat.jpg'
-    if na_file.exists():
-        na_ref = '/' + str(na_file.relative_to(ROOT.parent)).replace('\\','/')
-    categories.append({ 'key': 'not_a_cat', 'label': 'Not a Cat', 'reference': na_ref })
-    return { 'categories': categories }
+    return _CATEGORIES_RESPONSE
+
+class CatPicsStaticFiles(StaticFiles):
+    """StaticFiles for images: lets the browser reuse cached copies without revalidating each one.
+
+    StaticFiles already reuses its stat() result and answers ETag/If-Modified-Since with 304.
+    For high-volume deployments serve /cat_pics from a reverse proxy instead (see README).
+    """
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault('Cache-Control', 'public, max-age=3600')
+        return response
 
 # Serve static frontend (index.html) via separate server (e.g., uvicorn) pointing to /public route if needed.
-# We mount the entire project root's public folder at '/'.
+# Images get their own mount (matched first); the rest of the public folder is mounted at '/'.
 public_dir = Path(__file__).resolve().parent.parent / 'public'
+app.mount('/cat_pics', CatPicsStaticFiles(directory=str(ROOT)), name='cat_pics')
 app.mount('/', StaticFiles(directory=str(public_dir), html=True), name='public')
 
 # To run: uvicorn backend.main:app --reload --port 8000
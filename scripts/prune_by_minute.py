@@ -5,12 +5,13 @@ Filename pattern expected (default): processed_YYYYMMDD_HHMMSS_XXXXXX.jpg
 Example: processed_20250816_060153_097913.jpg
 
 It derives a minute key: YYYYMMDD_HHMM (first 13 chars after 'processed_') and keeps one file per minute.
-You can choose strategy: oldest, newest, or first_seen (default first_seen encountered in directory order),
-optionally doing a dry run.
+You can choose strategy: oldest, newest (by the timestamp embedded in the filename), or first_seen
+(default; first in name order), optionally doing a dry run.
 
 Usage:
   python prune_by_minute.py --root path/to/images --pattern "processed_*.jpg" --strategy newest --dry-run
   python prune_by_minute.py --root path/to/images --delete
+  python prune_by_minute.py --root path/to/images --delete --uring   # Linux, needs `pip install liburing`
 
 Safety:
  - By default is dry-run. Use --delete to actually remove.
@@ -20,38 +21,67 @@ Exit code 0 on success, >0 on error.
 """
 from __future__ import annotations
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import os
 from pathlib import Path
-import re
+import platform
 import sys
 from typing import Dict, List, Tuple
 
-FILENAME_RE = re.compile(r"processed_(\d{8})_(\d{6})_\d+\.[A-Za-z0-9]+$")
+PREFIX = "processed_"
 
 STRATEGIES = {"first_seen", "oldest", "newest"}
 
+UNLINK_WORKERS = 16  # concurrent unlink() calls; overlaps filesystem metadata writes
+URING_BATCH = 256  # unlinkat SQEs submitted per io_uring_enter in --uring mode
+
 def minute_key(name: str) -> str | None:
-    m = FILENAME_RE.match(name)
-    if not m:
+    """Return YYYYMMDD_HHMM for processed_YYYYMMDD_HHMMSS_<digits>.<ext> names, else None.
+
+    The prefix and timestamp are fixed-width, so they are sliced out directly rather than
+    run through a regex; this is called once per file in the directory.
+    """
+    # processed_YYYYMMDD_HHMMSS_ is 26 chars; need at least one digit, '.', one ext char
+    if len(name) < 29 or not name.startswith(PREFIX) or name[18] != '_' or name[25] != '_' or not name.isascii():
+        return None
+    date = name[10:18]
+    hms = name[19:25]
+    micros, dot, ext = name[26:].partition('.')
+    if not (date.isdigit() and hms.isdigit() and micros.isdigit() and dot and ext.isalnum()):
         return None
-    date, hms = m.groups()
     # hms = HHMMSS; minute = HHMM
-    return f"{date}_{hms[:4]}"  # YYYYMMDD_HHMM
-
-def collect_files(root: Path, pattern: str) -> List[Path]:
-    return sorted(root.glob(pattern))
-
-def choose_keep(files: List[Path], strategy: str) -> Path:
+    return date + '_' + hms[:4]  # YYYYMMDD_HHMM
+
+def collect_files(root: Path, pattern: str) -> List[os.DirEntry]:
+    """Return directory entries in root whose name matches pattern, sorted by name.
+
+    Uses a single os.scandir pass so file type checks come from the cached dirent.
+    """
+    with os.scandir(root) as it:
+        entries = [e for e in it if fnmatch.fnmatchcase(e.name, pattern) and e.is_file(follow_symlinks=False)]
+    entries.sort(key=lambda e: e.name)
+    return entries
+
+def capture_time(f: os.DirEntry) -> Tuple[str, int]:
+    """Sort key from the embedded YYYYMMDD_HHMMSS and microsecond parts of a name accepted by minute_key."""
+    name = f.name
+    return name[10:25], int(name[26:].partition('.')[0])
+
+def choose_keep(files: List[os.DirEntry], strategy: str) -> os.DirEntry:
+    # The filename timestamp is the capture time; unlike mtime it is not changed by
+    # later copies/touches, and comparing it needs no stat() calls.
     if strategy == 'first_seen':
         return files[0]
     elif strategy == 'oldest':
-        return min(files, key=lambda p: p.stat().st_mtime)
+        return min(files, key=capture_time)
     elif strategy == 'newest':
-        return max(files, key=lambda p: p.stat().st_mtime)
+        return max(files, key=capture_time)
     else:
         raise ValueError(f"Unknown strategy: {strategy}")
 
 def plan(root: Path, pattern: str, strategy: str) -> Tuple[List[Path], List[Path]]:
-    groups: Dict[str, List[Path]] = {}
+    groups: Dict[str, List[os.DirEntry]] = {}
     all_files = collect_files(root, pattern)
     for f in all_files:
         mk = minute_key(f.name)
@@ -62,21 +92,71 @@ def plan(root: Path, pattern: str, strategy: str) -> Tuple[List[Path], List[Path
     delete: List[Path] = []
     for mk, files in groups.items():
         if len(files) == 1:
-            keep.append(files[0])
+            keep.append(Path(files[0].path))
             continue
         chosen = choose_keep(files, strategy)
-        keep.append(chosen)
+        keep.append(Path(chosen.path))
         for f in files:
-            if f != chosen:
-                delete.append(f)
+            if f is not chosen:
+                delete.append(Path(f.path))
     return keep, delete
 
+def _try_unlink(f: Path) -> bool:
+    try:
+        os.unlink(f)
+        return True
+    except Exception as e:
+        print(f"Failed to delete {f}: {e}", file=sys.stderr)
+        return False
+
+def delete_files(files: List[Path]) -> int:
+    """Delete files using a small thread pool; returns the number removed."""
+    with ThreadPoolExecutor(max_workers=UNLINK_WORKERS) as ex:
+        return sum(ex.map(_try_unlink, files))
+
+def delete_files_uring(files: List[Path]) -> int:
+    """Delete files with batched io_uring unlinkat requests; returns the number removed.
+
+    Requires Linux 5.11+ and the optional `liburing` package.
+    """
+    from liburing import (Cqe, Ring, io_uring_cq_advance, io_uring_cq_ready, io_uring_get_sqe,
+                          io_uring_prep_unlink, io_uring_queue_exit, io_uring_queue_init,
+                          io_uring_sqe_set_data64, io_uring_submit_and_wait, io_uring_wait_cqe_nr)
+    ring = Ring()
+    cqe = Cqe()
+    io_uring_queue_init(URING_BATCH, ring)
+    removed = 0
+    try:
+        for start in range(0, len(files), URING_BATCH):
+            # The SQEs point at these paths' buffers, so keep the batch alive until it completes.
+            batch = files[start:start + URING_BATCH]
+            for i, f in enumerate(batch):
+                sqe = io_uring_get_sqe(ring)
+                io_uring_prep_unlink(sqe, f)
+                io_uring_sqe_set_data64(sqe, i)
+            io_uring_submit_and_wait(ring, len(batch))
+            io_uring_wait_cqe_nr(ring, cqe, len(batch))
+            ready = io_uring_cq_ready(ring)
+            for i in range(ready):
+                entry = cqe[i]
+                idx = entry.user_data
+                try:
+                    entry.res  # raises OSError for a failed unlink
+                    removed += 1
+                except OSError as e:
+                    print(f"Failed to delete {batch[idx]}: {e}", file=sys.stderr)
+            io_uring_cq_advance(ring, ready)
+    finally:
+        io_uring_queue_exit(ring)
+    return removed
+
 def main():
     ap = argparse.ArgumentParser(description="Prune images to one per minute.")
     ap.add_argument('--root', type=Path, required=True, help='Directory containing images')
-    ap.add_argument('--pattern', default='processed_*.jpg', help='Glob pattern (default processed_*.jpg)')
+    ap.add_argument('--pattern', default='processed_*.jpg', help='Filename glob pattern matched in --root (default processed_*.jpg)')
     ap.add_argument('--strategy', default='first_seen', choices=sorted(STRATEGIES), help='Which file to keep among duplicates for a minute')
     ap.add_argument('--delete', action='store_true', help='Actually delete (otherwise dry-run)')
+    ap.add_argument('--uring', action='store_true', help='Delete via batched io_uring requests (Linux, requires liburing)')
     ap.add_argument('--log', type=Path, help='Optional path to write a log summary (dry-run and real)')
     args = ap.parse_args()
 
@@ -95,24 +175,26 @@ def main():
         print(f"... and {len(delete)-20} more")
 
     if args.delete:
-        removed = 0
-        for f in delete:
+        use_uring = args.uring and platform.system() == 'Linux'
+        if args.uring and not use_uring:
+            print("--uring is only supported on Linux; using thread pool.", file=sys.stderr)
+        if use_uring:
             try:
-                f.unlink()
-                removed += 1
-            except Exception as e:
-                print(f"Failed to delete {f}: {e}", file=sys.stderr)
+                removed = delete_files_uring(delete)
+            except (ImportError, OSError) as e:
+                print(f"io_uring unavailable ({e}); using thread pool.", file=sys.stderr)
+                use_uring = False
+        if not use_uring:
+            removed = delete_files(delete)
         print(f"Deleted {removed} files.")
 
     if args.log:
         try:
-            with args.log.open('w', encoding='utf-8') as fh:
-                fh.write(f"strategy={args.strategy}\n")
-                fh.write(f"kept={len(keep)} deleted={len(delete)}\n")
-                for f in delete:
-                    fh.write(f"DELETE {f}\n")
-                for f in keep:
-                    fh.write(f"KEEP {f}\n")
+            lines = [f"strategy={args.strategy}\n", f"kept={len(keep)} deleted={len(delete)}\n"]
+            lines.extend(f"DELETE {f}\n" for f in delete)
+            lines.extend(f"KEEP {f}\n" for f in keep)
+            with args.log.open('w', encoding='utf-8', buffering=1 << 20) as fh:
+                fh.writelines(lines)
         except Exception as e:
             print(f"Failed to write log: {e}", file=sys.stderr)
 